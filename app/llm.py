@@ -2,11 +2,17 @@
 
 # Importing the necessary libraries
 from dotenv import load_dotenv
-from groq import Groq
+from groq import Groq, DefaultHttpxClient
+import httpx
 import os
+import hashlib
 import logging
-from typing import Generator, List, Dict, Any
-from retrieval import retrieve_documents
+import re
+import threading
+from collections import OrderedDict, deque
+from typing import Generator, List, Dict, Any, Optional, Tuple
+import numpy as np
+from retrieval import retrieve_documents, embed_query
 
 # Set up logging
 logging.basicConfig(level = logging.INFO, format = '%(asctime)s - %(levelname)s - %(message)s')
@@ -15,8 +21,16 @@ logger = logging.getLogger(__name__)
 # Loading the environment variables
 load_dotenv()
 
-# Initializing the Groq client
-client = Groq(api_key = os.getenv("GROQ_API_KEY"))
+# Initializing the Groq client over a pooled HTTP/2 connection that is kept alive between requests,
+# so chat turns don't each pay a new TLS handshake
+client = Groq(
+    api_key = os.getenv("GROQ_API_KEY"),
+    http_client = DefaultHttpxClient(
+        http2 = True,
+        limits = httpx.Limits(max_keepalive_connections = 32, keepalive_expiry = 300),
+        timeout = httpx.Timeout(60.0, connect = 5.0)
+    )
+)
 
 # System message for PDF explainer
 SYSTEM_MESSAGE = """You are a helpful AI assistant that specializes in explaining and analyzing PDF documents. 
@@ -32,63 +46,225 @@ Guidelines for document-based responses:
 
 You are knowledgeable, helpful, and focused on making document content accessible and understandable. When no documents are available, you can still assist with general questions using your training knowledge."""
 
-def chat_with_assistant_rag(message: str, history: List[Dict[str, Any]], collection_name: str) -> Generator[str, None, None]:
+# Cache of retrieval results for repeated questions, keyed by (collection name, query hash, top_k)
+RETRIEVAL_CACHE_SIZE = 512
+_retrieval_cache: "OrderedDict[Tuple[str, bytes, int], Dict[str, Any]]" = OrderedDict()
+_retrieval_cache_lock = threading.Lock()
+_retrieval_cache_generation = 0
+
+# Second-tier cache for paraphrased questions: recent query embeddings and their results, per (collection name, top_k)
+SEMANTIC_CACHE_SIZE = 256
+SEMANTIC_CACHE_THRESHOLD = 0.95
+_semantic_cache: Dict[Tuple[str, int], Tuple[np.ndarray, List[Dict[str, Any]]]] = {}
+
+def _semantic_cache_lookup(cache_key: Tuple[str, int], query_embedding: np.ndarray) -> Optional[Dict[str, Any]]:
     """
-    Chat with the assistant using RAG (streaming).
+    Find the cached result of the most similar earlier query. Caller must hold _retrieval_cache_lock.
+    
+    Args:
+        cache_key (Tuple[str, int]): Collection name and top_k
+        query_embedding (np.ndarray): L2-normalized query embedding
+        
+    Returns:
+        Optional[Dict[str, Any]]: Cached query results, or None if no earlier query is similar enough
+    """
+    if cache_key not in _semantic_cache:
+        return None
+    
+    embeddings, results_list = _semantic_cache[cache_key]
+    # Embeddings are normalized, so the dot product is the cosine similarity
+    scores = embeddings @ query_embedding
+    best = int(np.argmax(scores))
+    if scores[best] >= SEMANTIC_CACHE_THRESHOLD:
+        return results_list[best]
+    return None
+
+def _semantic_cache_add(cache_key: Tuple[str, int], query_embedding: np.ndarray, results: Dict[str, Any]) -> None:
+    """
+    Add a query embedding and its results to the semantic cache, evicting the oldest entry when full.
+    Caller must hold _retrieval_cache_lock.
+    
+    Args:
+        cache_key (Tuple[str, int]): Collection name and top_k
+        query_embedding (np.ndarray): L2-normalized query embedding
+        results (Dict[str, Any]): Query results from ChromaDB
+    """
+    if cache_key in _semantic_cache:
+        embeddings, results_list = _semantic_cache[cache_key]
+        embeddings = np.vstack((embeddings[-(SEMANTIC_CACHE_SIZE - 1):], query_embedding))
+        results_list = results_list[-(SEMANTIC_CACHE_SIZE - 1):] + [results]
+    else:
+        embeddings, results_list = query_embedding[np.newaxis, :], [results]
+    _semantic_cache[cache_key] = (embeddings, results_list)
+
+def retrieve_documents_cached(collection_name: str, query: str, top_k: int = 5) -> Dict[str, Any]:
+    """
+    Retrieve documents for a query, reusing the result of an earlier identical or near-identical query when available.
     
     Args:
-        message (str): User message
-        history (List[Dict[str, Any]]): Conversation history
         collection_name (str): ChromaDB collection name
+        query (str): Query text
+        top_k (int): Number of top results to return
         
-    Yields:
-        str: Streaming response chunks
+    Returns:
+        Dict[str, Any]: Query results from ChromaDB
     """
-    logger.info(f"Processing RAG chat request with message length: {len(message)}")
+    # The embedding model is uncased, so case and surrounding whitespace do not change the result
+    key = (collection_name, hashlib.sha256(query.strip().lower().encode()).digest(), top_k)
+    semantic_key = (collection_name, top_k)
+    
+    with _retrieval_cache_lock:
+        if key in _retrieval_cache:
+            _retrieval_cache.move_to_end(key)
+            return _retrieval_cache[key]
+        generation = _retrieval_cache_generation
     
-    # Build the messages array for the API call
-    messages = []
+    # Compare against recent queries before searching the whole collection
+    query_embedding = embed_query(query)
+    with _retrieval_cache_lock:
+        results = _semantic_cache_lookup(semantic_key, query_embedding)
+    
+    semantic_hit = results is not None
+    if not semantic_hit:
+        results = retrieve_documents(collection_name, query, top_k = top_k, query_embedding = query_embedding)
+    
+    with _retrieval_cache_lock:
+        # Don't store results computed before documents were added in the meantime
+        if generation == _retrieval_cache_generation:
+            _retrieval_cache[key] = results
+            if len(_retrieval_cache) > RETRIEVAL_CACHE_SIZE:
+                _retrieval_cache.popitem(last = False)
+            if not semantic_hit:
+                _semantic_cache_add(semantic_key, query_embedding, results)
+    
+    return results
+
+def clear_retrieval_cache() -> None:
+    """
+    Invalidate cached retrieval results. Must be called whenever documents are added to a collection.
+    """
+    global _retrieval_cache_generation
+    with _retrieval_cache_lock:
+        _retrieval_cache.clear()
+        _semantic_cache.clear()
+        _retrieval_cache_generation += 1
+
+# Separator between the user's question and the retrieved excerpts
+CONTEXT_HEADER = "\n\n[CONTEXT - Please use these relevant excerpts from my uploaded documents to help answer the question:]\n\n"
+
+# Messages that consist only of a greeting or acknowledgement
+_SMALL_TALK_RE = re.compile(r'^\s*(hi|hello|hey|thanks|thank you|ok|okay)\b[\s!.,]*$', re.IGNORECASE)
+
+# Conversation messages per Gradio session, so each turn appends to the previous ones instead of
+# rebuilding them from the full history. Only the most recent messages are sent to Groq.
+MAX_HISTORY_MESSAGES = 40
+MAX_CACHED_SESSIONS = 256
+_session_messages: "OrderedDict[str, Tuple[int, deque]]" = OrderedDict()
+_session_messages_lock = threading.Lock()
+
+def _get_history_messages(history: List[Dict[str, Any]], session_id: Optional[str]) -> deque:
+    """
+    Get the conversation so far as API messages, reusing the session's cached messages when they match the history.
     
-    # Always add the base system message first
-    messages.append({"role": "system", "content": SYSTEM_MESSAGE})
+    Args:
+        history (List[Dict[str, Any]]): Conversation history
+        session_id (Optional[str]): Gradio session hash, or None to always rebuild from history
+        
+    Returns:
+        deque: The most recent MAX_HISTORY_MESSAGES user and assistant messages
+    """
+    if session_id is not None:
+        with _session_messages_lock:
+            cached = _session_messages.get(session_id)
+        # The cache is only valid if nothing was retried, undone or cleared since the last turn
+        if cached is not None and cached[0] == len(history):
+            return cached[1]
     
-    # Add conversation history if available
+    history_messages = deque(maxlen = MAX_HISTORY_MESSAGES)
     if history:
         for msg in history:
             # With type='messages', history contains message objects with 'role' and 'content'
             if isinstance(msg, dict) and 'role' in msg and 'content' in msg:
                 # Skip system messages from history to avoid duplicates
                 if msg['role'] != 'system':
-                    messages.append({"role": msg['role'], "content": msg['content']})
+                    history_messages.append({"role": msg['role'], "content": msg['content']})
+    return history_messages
+
+def _remember_turn(session_id: Optional[str], history_length: int, history_messages: deque, message: str, response: str) -> None:
+    """
+    Append a finished turn to the session's cached messages.
+    
+    Args:
+        session_id (Optional[str]): Gradio session hash, or None to skip caching
+        history_length (int): Length of the history the turn was answered from
+        history_messages (deque): Messages returned by _get_history_messages for that history
+        message (str): User message, without retrieved context (as it appears in the history)
+        response (str): Full assistant response
+    """
+    if session_id is None:
+        return
+    
+    history_messages.append({"role": "user", "content": message})
+    history_messages.append({"role": "assistant", "content": response})
+    
+    with _session_messages_lock:
+        # Gradio adds the user message and the response to the history for the next turn
+        _session_messages[session_id] = (history_length + 2, history_messages)
+        _session_messages.move_to_end(session_id)
+        if len(_session_messages) > MAX_CACHED_SESSIONS:
+            _session_messages.popitem(last = False)
+
+def chat_with_assistant_rag(message: str, history: List[Dict[str, Any]], collection_name: str, session_id: Optional[str] = None) -> Generator[str, None, None]:
+    """
+    Chat with the assistant using RAG (streaming).
+    
+    Args:
+        message (str): User message
+        history (List[Dict[str, Any]]): Conversation history
+        collection_name (str): ChromaDB collection name
+        session_id (Optional[str]): Gradio session hash used to cache the conversation between turns
+        
+    Yields:
+        str: Streaming response chunks
+    """
+    logger.info("Processing RAG chat request with message length: %d", len(message))
+    
+    # Conversation history if available
+    history_length = len(history) if history else 0
+    history_messages = _get_history_messages(history, session_id)
     
     # Try to retrieve relevant documents for the current question
     has_relevant_docs = False
     enhanced_message = message
-    try:
-        results = retrieve_documents(collection_name, message, top_k = 5)
-        
-        # Check if we have any documents
-        if results and results.get('documents') and results['documents'][0]:
-            # Add retrieved documents as context to the user's message
-            context_parts = []
-            for i, doc in enumerate(results['documents'][0]):
-                context_parts.append(f"Filename = {results['metadatas'][0][i]['filename']}, Page = {results['metadatas'][0][i]['page']}:\n{doc}")
-            
-            context = "\n\n".join(context_parts)
-            enhanced_message = f"{message}\n\n[CONTEXT - Please use these relevant excerpts from my uploaded documents to help answer the question:]\n\n{context}"
-            has_relevant_docs = True
+    # Greetings and acknowledgements have nothing to look up, so skip embedding and search for them
+    if _SMALL_TALK_RE.match(message):
+        logger.info("Skipping document retrieval for small talk message")
+    else:
+        try:
+            results = retrieve_documents_cached(collection_name, message, top_k = 5)
             
-            logger.info(f"Retrieved {len(results['documents'][0])} relevant documents for context")
-        else:
-            logger.info("No documents available in collection")
-            
-    except Exception as e:
-        logger.warning(f"Error retrieving documents: {str(e)}")
+            # Check if we have any documents
+            if results and results.get('documents') and results['documents'][0]:
+                # Add retrieved documents as context to the user's message, formatted straight into a single join
+                context = "\n\n".join(
+                    f"Filename = {metadata['filename']}, Page = {metadata['page']}:\n{doc}"
+                    for doc, metadata in zip(results['documents'][0], results['metadatas'][0])
+                )
+                enhanced_message = "".join((message, CONTEXT_HEADER, context))
+                has_relevant_docs = True
+                
+                logger.info("Retrieved %d relevant documents for context", len(results['documents'][0]))
+            else:
+                logger.info("No documents available in collection")
+                
+        except Exception as e:
+            logger.warning("Error retrieving documents: %s", e)
     
-    # Add the current user message (with context if available)
-    messages.append({"role": "user", "content": enhanced_message})
+    # Build the messages array for the API call: base system message first, then the history
+    # and the current user message (with context if available)
+    messages = [{"role": "system", "content": SYSTEM_MESSAGE}, *history_messages, {"role": "user", "content": enhanced_message}]
     
-    logger.info(f"Sending {len(messages)} messages to Groq API (documents found: {has_relevant_docs})")
+    logger.info("Sending %d messages to Groq API (documents found: %s)", len(messages), has_relevant_docs)
     
     try:
         # Create streaming response
@@ -101,15 +277,18 @@ def chat_with_assistant_rag(message: str, history: List[Dict[str, Any]], collect
             stream = True,
         )
         
-        # Yield streaming response
-        partial_response = ""
+        # Yield streaming response. ChatInterface replaces the message with each yielded value,
+        # so collect the deltas and only yield when the text actually changed (skips empty role/stop chunks)
+        response_parts: List[str] = []
         for chunk in stream:
-            if chunk.choices[0].delta.content is not None:
-                partial_response += chunk.choices[0].delta.content
-                yield partial_response
-                
+            delta = chunk.choices[0].delta.content
+            if delta:
+                response_parts.append(delta)
+                yield "".join(response_parts)
+        
+        _remember_turn(session_id, history_length, history_messages, message, "".join(response_parts))
         logger.info("Successfully completed streaming response")
         
     except Exception as e:
-        logger.error(f"Error calling Groq API: {str(e)}")
+        logger.error("Error calling Groq API: %s", e)
         yield f"I apologize, but I'm experiencing a technical issue: {str(e)}"
\ No newline at end of file
@@ -1,40 +1,127 @@
 # This file contains the functions for the text processing and document retrieval segment of the chatbot
 
 import os
-from typing import List, Dict, Any
+import json
+import hashlib
+import logging
+import multiprocessing
+import platform
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from itertools import islice, repeat
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import numpy as np
+import pymupdf
 import pymupdf4llm
 import re
 import unicodedata
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_text_splitters import Language, RecursiveCharacterTextSplitter
 import chromadb
 from chromadb.utils import embedding_functions
 
+# Set up logging
+logger = logging.getLogger(__name__)
 
-def parse_pdf(filepath: str, write_images: bool = False) -> List[Dict[str, Any]]:
+
+# Documents with at least this many pages have their page ranges parsed in parallel
+PARALLEL_PARSE_MIN_PAGES = 16
+
+# Pages per range handed to a parse worker; small ranges keep output streaming and the workers evenly loaded
+PARSE_RANGE_PAGES = 8
+
+
+def _new_process_pool() -> ProcessPoolExecutor:
     """
-    Parse a PDF file and extract text with metadata from each page using pymupdf4llm.
+    Create a worker pool for CPU-bound steps, with one worker per core.
+    
+    Workers are never forked from this process: by the time a pool is created it already runs
+    torch/onnxruntime, Chroma and Gradio threads, and forking a multithreaded process can deadlock.
+    Where available they are forked from a clean forkserver process that has this module preloaded,
+    so each worker starts without importing it again; elsewhere they are spawned.
+    
+    Returns:
+        ProcessPoolExecutor: New process pool
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("forkserver")
+        mp_context.set_forkserver_preload([__name__])
+    else:
+        mp_context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers = os.cpu_count(), mp_context = mp_context)
+
+
+@lru_cache(maxsize = 1)
+def _get_file_pool() -> ProcessPoolExecutor:
+    """
+    Get the worker pool for parsing whole files. Created on first use and kept for later uploads,
+    so batches don't pay worker start-up each time.
+    
+    Returns:
+        ProcessPoolExecutor: Shared process pool for file parses
+    """
+    return _new_process_pool()
+
+
+@lru_cache(maxsize = 1)
+def _get_page_pool() -> ProcessPoolExecutor:
+    """
+    Get the worker pool for page-level work (parsing page ranges, cleaning and chunking pages).
+    Kept apart from the file pool so these short tasks don't queue behind whole-file parses.
+    
+    Returns:
+        ProcessPoolExecutor: Shared process pool for page-level work
+    """
+    return _new_process_pool()
+
+
+def _iter_page_range(doc: Any, filepath: str, start: int, stop: int, hdr_info: Any, write_images: bool, keep_source_metadata: bool) -> Iterator[Dict[str, Any]]:
+    """
+    Parse a range of pages of an open PDF document with pymupdf4llm, one page at a time.
     
     Args:
+        doc (Any): Open pymupdf document
         filepath (str): Path to the PDF file
+        start (int): Index of the first page to parse
+        stop (int): Index after the last page to parse
+        hdr_info (Any): Header levels identified for the whole document (None for pymupdf4llm's default)
         write_images (bool): Whether to extract and save images from the PDF
+        keep_source_metadata (bool): Whether to keep pymupdf4llm's own page metadata, stored as a single JSON string
         
-    Returns:
-        list: List of dictionaries with format including filename, page, text, and additional metadata
+    Yields:
+        Dict[str, Any]: Page dictionary with format including filename, page, text, and additional metadata
     """
-    result = []
-    
     # Extract filename from filepath
     filename = os.path.basename(filepath)
     
-    try:
-        # Extract text using pymupdf4llm with page-wise extraction
-        page_data_list = pymupdf4llm.to_markdown(
-            filepath, 
-            page_chunks = True,
-            write_images = write_images
-        )
+    for page_number in range(start, stop):
+        try:
+            # Extract text using pymupdf4llm with page-wise extraction
+            page_data_list = pymupdf4llm.to_markdown(
+                doc,
+                pages = [page_number],
+                hdr_info = hdr_info,
+                page_chunks = True,
+                write_images = write_images
+            )
+        except Exception as e:
+            logger.warning("Error parsing page %d of PDF %s: %s", page_number + 1, filepath, e)
+            # Fallback: try without page chunks
+            try:
+                md_text_fallback = pymupdf4llm.to_markdown(doc, pages = [page_number], write_images = write_images)
+            except Exception as fallback_error:
+                logger.warning("Fallback extraction also failed for page %d of %s: %s", page_number + 1, filepath, fallback_error)
+                continue
+            
+            yield {
+                'filename': filename,
+                'page': page_number + 1,
+                'text': md_text_fallback
+            }
+            continue
         
-        # Process each page's data
+        # Process the page's data
         for page_info in page_data_list:
             # Extract the text content
             page_text = page_info.get('text', '')
@@ -43,50 +130,269 @@ def parse_pdf(filepath: str, write_images: bool = False) -> List[Dict[str, Any]]
             # Create enhanced page data dictionary
             enhanced_page_data = {
                 'filename': filename,
-                'page': page_metadata.get('page', 0),
-                'text': page_text,
-                'text_format': 'markdown',
-                'extraction_method': 'pymupdf4llm',
-                'has_tables': '|' in page_text,  # Basic table detection
-                'char_count': len(page_text),
-                'word_count': len(page_text.split()),
-                'line_count': len(page_text.split('\n')),
-                'images_extracted': write_images,
-                'source_bbox': page_metadata.get('bbox', None),
-                'source_page_size': page_metadata.get('page_size', None)
+                'page': page_metadata.get('page', page_number + 1),
+                'text': page_text
             }
             
-            # Add any additional metadata from pymupdf4llm
-            for key, value in page_metadata.items():
-                if key not in ['page', 'bbox', 'page_size']:  # Avoid duplicates
-                    enhanced_page_data[f'source_{key}'] = value
+            # Add the metadata from pymupdf4llm as one column rather than one key per field,
+            # since every key ends up in every chunk's metadata row
+            if keep_source_metadata:
+                source_metadata = {key: value for key, value in page_metadata.items() if key != 'page'}  # Avoid duplicates
+                enhanced_page_data['source_metadata'] = json.dumps(source_metadata, default = str)
             
-            result.append(enhanced_page_data)
-                
+            yield enhanced_page_data
+
+
+def _parse_page_range(filepath: str, start: int, stop: int, hdr_info: Any, write_images: bool, keep_source_metadata: bool) -> List[Dict[str, Any]]:
+    """
+    Parse a range of pages of a PDF file. Worker entry point for parse_pdf; opens its own copy of the document.
+    
+    Args:
+        filepath (str): Path to the PDF file
+        start (int): Index of the first page to parse
+        stop (int): Index after the last page to parse
+        hdr_info (Any): Header levels identified for the whole document
+        write_images (bool): Whether to extract and save images from the PDF
+        keep_source_metadata (bool): Whether to keep pymupdf4llm's own page metadata
+        
+    Returns:
+        List[Dict[str, Any]]: Page dictionaries for the range, in page order
+    """
+    with pymupdf.open(filepath) as doc:
+        return list(_iter_page_range(doc, filepath, start, stop, hdr_info, write_images, keep_source_metadata))
+
+
+def parse_pdf(filepath: str, write_images: bool = False, keep_source_metadata: bool = False, parallel: bool = True) -> Iterator[Dict[str, Any]]:
+    """
+    Parse a PDF file and extract text with metadata from each page using pymupdf4llm.
+    
+    Small documents are converted one page at a time, so callers can start indexing early pages
+    while later ones are still being parsed. Large documents are split into short page ranges
+    that worker processes parse in parallel; ranges are yielded in page order as they finish,
+    with only a few ranges per worker in flight at a time.
+    
+    Args:
+        filepath (str): Path to the PDF file
+        write_images (bool): Whether to extract and save images from the PDF
+        keep_source_metadata (bool): Whether to keep pymupdf4llm's own page metadata, stored as a single JSON string
+        parallel (bool): Whether large documents may be parsed across worker processes
+        
+    Yields:
+        Dict[str, Any]: Page dictionary with format including filename, page, text, and additional metadata
+    """
+    try:
+        doc = pymupdf.open(filepath)
     except Exception as e:
-        print(f"Error parsing PDF {filepath}: {str(e)}")
-        # Fallback: try without page chunks
+        logger.warning("Error opening PDF %s: %s", filepath, e)
+        return
+    
+    with doc:
+        page_count = doc.page_count
+        # Identify header font sizes once for the whole document so heading levels stay consistent across pages
         try:
-            md_text_fallback = pymupdf4llm.to_markdown(filepath, write_images = write_images)
-            page_data = {
-                'filename': filename,
-                'page': 1,
-                'text': md_text_fallback,
-                'text_format': 'markdown',
-                'extraction_method': 'pymupdf4llm_fallback',
-                'has_tables': '|' in md_text_fallback,
-                'char_count': len(md_text_fallback),
-                'word_count': len(md_text_fallback.split()),
-                'line_count': len(md_text_fallback.split('\n')),
-                'images_extracted': write_images,
-                'error_note': 'Page-wise extraction failed, using full document'
-            }
-            result.append(page_data)
-        except Exception as fallback_error:
-            print(f"Fallback extraction also failed for {filepath}: {str(fallback_error)}")
-            return []
+            hdr_info = pymupdf4llm.IdentifyHeaders(doc)
+        except Exception as e:
+            logger.warning("Error identifying headers in PDF %s: %s", filepath, e)
+            hdr_info = None
+        
+        # Image extraction writes files and returns large payloads, so keep it in this process
+        workers = os.cpu_count() or 1
+        if not parallel or write_images or workers == 1 or page_count < PARALLEL_PARSE_MIN_PAGES:
+            yield from _iter_page_range(doc, filepath, 0, page_count, hdr_info, write_images, keep_source_metadata)
+            return
+    
+    # Each worker opens its own copy of the document and parses one short range at a time.
+    # Submit ranges as earlier ones are consumed, so parsed pages waiting to be yielded stay bounded.
+    pool = _get_page_pool()
+    starts = iter(range(0, page_count, PARSE_RANGE_PAGES))
+    pending = deque()
+    
+    def submit_next() -> None:
+        start = next(starts, None)
+        if start is not None:
+            stop = min(start + PARSE_RANGE_PAGES, page_count)
+            pending.append(pool.submit(_parse_page_range, filepath, start, stop, hdr_info, write_images, keep_source_metadata))
     
-    return result
+    try:
+        for _ in range(2 * workers):
+            submit_next()
+        while pending:
+            pages = pending.popleft().result()
+            submit_next()
+            yield from pages
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): fail this document, and let the next one start a fresh pool
+        logger.error("Worker pool broke while parsing %s", filepath)
+        _get_page_pool.cache_clear()
+        raise
+
+
+def _parse_pdf_to_list(filepath: str, write_images: bool, keep_source_metadata: bool) -> List[Dict[str, Any]]:
+    """
+    Parse a whole PDF into a list of pages. Worker entry point for parse_pdfs, since generators can't be pickled.
+    Files are already spread across workers there, so pages are parsed sequentially.
+    
+    Args:
+        filepath (str): Path to the PDF file
+        write_images (bool): Whether to extract and save images from the PDF
+        keep_source_metadata (bool): Whether to keep pymupdf4llm's own page metadata
+        
+    Returns:
+        List[Dict[str, Any]]: All pages of the PDF as returned by parse_pdf
+    """
+    return list(parse_pdf(filepath, write_images, keep_source_metadata, parallel = False))
+
+
+def compute_file_hash(filepath: str) -> str:
+    """
+    Hash the contents of a file, so the same document is recognized whatever its name.
+    
+    Args:
+        filepath (str): Path to the file
+        
+    Returns:
+        str: Hex digest (32 characters) of the file's BLAKE2b hash
+    """
+    file_hash = hashlib.blake2b(digest_size = 16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def parse_pdfs(pdf_list: List[str], write_images: bool = False, keep_source_metadata: bool = False, doc_hashes: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Parse multiple PDF files in parallel and tag each page with its position in the batch and its file's content hash.
+    
+    Args:
+        pdf_list (List[str]): Paths to the PDF files
+        write_images (bool): Whether to extract and save images from the PDFs
+        keep_source_metadata (bool): Whether to keep pymupdf4llm's own page metadata
+        doc_hashes (Optional[List[str]]): Content hashes of the files from compute_file_hash (computed if None)
+        
+    Yields:
+        Dict[str, Any]: Page dictionary with added 'file_index' and 'doc_hash' keys, in file and page order
+    """
+    if not pdf_list:
+        return
+    
+    batch_size = len(pdf_list)
+    if doc_hashes is None:
+        doc_hashes = [compute_file_hash(pdf_path) for pdf_path in pdf_list]
+    
+    # A single file gains nothing from a worker pool, so stream its pages directly. Image extraction returns
+    # large payloads that are costly to pickle, and PyMuPDF is neither thread-safe nor releases the GIL,
+    # so in that case the files are parsed one after another in this process.
+    if batch_size == 1 or write_images:
+        for file_index, pdf_path in enumerate(pdf_list):
+            for page_data in parse_pdf(pdf_path, write_images, keep_source_metadata):
+                page_data['file_index'] = file_index
+                page_data['doc_hash'] = doc_hashes[file_index]
+                yield page_data
+        return
+    
+    # Each PDF is independent and parsing is CPU-bound, so spread the files across the file pool.
+    # Keep only a couple of files per worker in flight so parsed pages don't pile up faster than they are consumed.
+    pool = _get_file_pool()
+    workers = os.cpu_count() or 1
+    files = enumerate(pdf_list)
+    pending = deque()
+    
+    def submit_next() -> None:
+        item = next(files, None)
+        if item is not None:
+            file_index, pdf_path = item
+            pending.append((file_index, pool.submit(_parse_pdf_to_list, pdf_path, write_images, keep_source_metadata)))
+    
+    try:
+        for _ in range(2 * workers):
+            submit_next()
+        
+        # Hand each file's pages over in order, refilling the window as files are consumed. The future is
+        # dropped once popped, so a file's pages are only held while they are being yielded.
+        while pending:
+            file_index, future = pending.popleft()
+            pages = future.result()
+            del future
+            submit_next()
+            for page_data in pages:
+                page_data['file_index'] = file_index
+                page_data['doc_hash'] = doc_hashes[file_index]
+                yield page_data
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory): fail this upload, and let the next one start a fresh pool
+        logger.error("Worker pool broke while parsing %d files", batch_size)
+        _get_file_pool.cache_clear()
+        raise
+
+
+# Precompiled patterns and tables used by clean_text
+# Single-character substitutions: normalize quotes, drop zero-width characters, old Mac line endings to Unix
+_CHAR_SUBSTITUTIONS = {
+    '\u201C': '"', '\u201D': '"', '\u201E': '"',
+    '\u2018': "'", '\u2019': "'",
+    '\u200B': '', '\u200C': '', '\u200D': '', '\uFEFF': '',
+    '\r': '\n'
+}
+_SPECIAL_CHAR_RE = re.compile('[' + ''.join(_CHAR_SUBSTITUTIONS) + ']')
+
+# Hyphenated words broken across lines
+_HYPHENATED_BREAK_RE = re.compile(r'(?<=\w)-\s*\n\s*(?=\w)')
+
+# Any whitespace run that needs normalizing: spaces/tabs around newlines, repeated spaces, tabs
+_WHITESPACE_RE = re.compile(r'[ \t]*\n[ \t\n]*|[ \t]{2,}|\t')
+
+# Standalone page numbers and roman numerals (common in headers/footers)
+_PAGE_MARKER_RE = re.compile(r'\n\s*(?:\d+|[ivxlcdm]+)\s*(?=\n)', re.IGNORECASE)
+
+# Markdown table, list and header spacing, one named alternative per marker so a single scan handles them all
+_MARKDOWN_SPACING_RE = re.compile(
+    r'(?P<pipe> +\| +)|^(?P<leading_pipe>\| +)|(?P<trailing_pipe> +\|)$'
+    r'|\n +(?P<list_marker>[•\-\*\+]|\d+\.|#+)|(?P<header>#+) +(?=[^\n])',
+    re.MULTILINE
+)
+
+# Excessive punctuation
+# Runs of four or more dots or dashes (runs of exactly three are already in their final form)
+_PUNCTUATION_RUN_RE = re.compile(r'([.-])\1{3,}')
+
+
+def _normalize_whitespace(match: re.Match) -> str:
+    """
+    Replacement callback for _WHITESPACE_RE.
+    
+    Args:
+        match (re.Match): Matched whitespace run
+        
+    Returns:
+        str: A single space, a single newline, or a paragraph break (newlines capped at two)
+    """
+    newline_count = match.group().count('\n')
+    if newline_count == 0:
+        return ' '
+    return '\n\n' if newline_count > 1 else '\n'
+
+
+def _fix_markdown_spacing(match: re.Match) -> str:
+    """
+    Replacement callback for _MARKDOWN_SPACING_RE, dispatching on the alternative that matched.
+    
+    Args:
+        match (re.Match): Matched marker with its surrounding spaces
+        
+    Returns:
+        str: The marker with normalized spacing
+    """
+    kind = match.lastgroup
+    if kind == 'pipe':
+        return ' | '
+    if kind == 'leading_pipe':
+        return '| '
+    if kind == 'trailing_pipe':
+        return ' |'
+    if kind == 'list_marker':
+        return '\n' + match.group('list_marker')
+    return match.group('header') + ' '
 
 
 def clean_text(text: str) -> str:
@@ -102,68 +408,92 @@ def clean_text(text: str) -> str:
     if not text or not text.strip():
         return ""
     
-    # Normalize unicode characters
-    text = unicodedata.normalize('NFKD', text)
+    # Each pass below is guarded by a cheap C-level check so pages that are already clean skip it
+    text = text.replace('\r\n', '\n')
+    if text.isascii():
+        # ASCII is already NFKD-normalized and '\r' is the only substitution that can apply
+        text = text.replace('\r', '\n')
+    else:
+        # Normalize unicode characters
+        if not unicodedata.is_normalized('NFKD', text):
+            text = unicodedata.normalize('NFKD', text)
+        
+        # Single-character substitutions in one pass (quotes, zero-width characters, line endings)
+        text = _SPECIAL_CHAR_RE.sub(lambda match: _CHAR_SUBSTITUTIONS[match.group()], text)
     
     # Fix common PDF extraction artifacts
     # Fix hyphenated words broken across lines
-    text = re.sub(r'(\w+)-\s*\n\s*(\w+)', r'\1\2', text)
+    if '-' in text:
+        text = _HYPHENATED_BREAK_RE.sub('', text)
     
-    # Remove excessive whitespace while preserving structure
-    text = re.sub(r' +', ' ', text)  # Multiple spaces to single space
-    text = re.sub(r'\t+', ' ', text)  # Tabs to single space
-    text = re.sub(r'\n +', '\n', text)  # Remove spaces after newlines
-    text = re.sub(r' +\n', '\n', text)  # Remove spaces before newlines
-    
-    # Normalize line breaks (preserve paragraph structure)
-    text = re.sub(r'\n{3,}', '\n\n', text)  # Max 2 consecutive newlines
-    text = re.sub(r'\r\n', '\n', text)  # Windows line endings to Unix
-    text = re.sub(r'\r', '\n', text)  # Old Mac line endings to Unix
+    # Remove excessive whitespace while preserving structure (max 2 consecutive newlines)
+    text = _WHITESPACE_RE.sub(_normalize_whitespace, text)
     
     # Clean up common PDF artifacts
-    # Remove standalone page numbers (numbers on their own line)
-    text = re.sub(r'\n\s*\d+\s*\n', '\n', text)
-    
-    # Remove standalone roman numerals (common in headers/footers)
-    text = re.sub(r'\n\s*[ivxlcdm]+\s*\n', '\n', text, flags = re.IGNORECASE)
+    # Remove standalone page numbers and roman numerals (numbers on their own line)
+    text = _PAGE_MARKER_RE.sub('', text)
     
-    # Clean up markdown table formatting (preserve structure but clean spacing)
-    # Fix spacing around table delimiters
-    text = re.sub(r' +\| +', ' | ', text)  # Normalize spacing around pipes
-    text = re.sub(r'^\| +', '| ', text, flags = re.MULTILINE)  # Start of line pipes
-    text = re.sub(r' +\|$', ' |', text, flags = re.MULTILINE)  # End of line pipes
-    
-    # Preserve list formatting but clean spacing
-    text = re.sub(r'\n +([•\-\*\+])', r'\n\1', text)  # Bullet lists
-    text = re.sub(r'\n +(\d+\.)', r'\n\1', text)  # Numbered lists
-    
-    # Clean up header formatting (preserve markdown headers)
-    text = re.sub(r'\n +(#+)', r'\n\1', text)  # Remove spaces before headers
-    text = re.sub(r'(#+) +([^\n]+)', r'\1 \2', text)  # Normalize header spacing
+    # Clean up markdown table, list and header spacing (preserve structure) in one pass
+    text = _MARKDOWN_SPACING_RE.sub(_fix_markdown_spacing, text)
     
     # Remove excessive punctuation (but preserve meaningful punctuation)
-    text = re.sub(r'\.{3,}', '...', text)  # Multiple dots to ellipsis
-    text = re.sub(r'-{3,}', '---', text)  # Multiple dashes to em dash
-    
-    # Clean up quote marks
-    text = re.sub(r'[\u201C\u201D\u201E]', '"', text)  # Normalize quotes
-    text = re.sub(r'[\u2018\u2019]', "'", text)  # Normalize apostrophes
-    
-    # Remove zero-width characters and other invisible characters
-    text = re.sub(r'[\u200B\u200C\u200D\uFEFF]', '', text)
+    # Multiple dots to ellipsis, multiple dashes to em dash
+    if '....' in text or '----' in text:
+        text = _PUNCTUATION_RUN_RE.sub(r'\1\1\1', text)
     
     # Final cleanup
-    text = text.strip()  # Remove leading/trailing whitespace
-    
-    # Ensure text doesn't start or end with newlines after cleaning
-    text = text.strip('\n')
+    return text.strip()
+
+
+# Markdown-aware separators from LangChain, in order of preference (headings, code fence ends,
+# horizontal rules, then paragraphs, lines and words)
+MARKDOWN_SEPARATORS = RecursiveCharacterTextSplitter.get_separators_for_language(Language.MARKDOWN)
+
+# Structural separators end a chunk anywhere in the window, like the recursive splitter's first levels;
+# paragraph, line and word breaks are only looked for near the window end
+_PARAGRAPH_SEPARATOR_INDEX = MARKDOWN_SEPARATORS.index('\n\n')
+_STRUCTURAL_SEPARATOR_RES = [re.compile(separator) for separator in MARKDOWN_SEPARATORS[:_PARAGRAPH_SEPARATOR_INDEX]]
+_BOUNDARY_SEPARATORS = [separator for separator in MARKDOWN_SEPARATORS[_PARAGRAPH_SEPARATOR_INDEX:] if separator]
+
+# How far past the window end a structural separator starting inside it may extend
+_SEPARATOR_LOOKAHEAD = 16
+
+
+def _find_separator(pattern: re.Pattern, text: str, start: int, end: int, last: bool) -> int:
+    """
+    Find where the first or last match of a pattern beginning within text[start:end] begins. The match
+    itself may run past end, so a heading straddling the window end still ends the chunk before it.
     
-    return text
+    Args:
+        pattern (re.Pattern): Compiled separator pattern
+        text (str): Text to search
+        start (int): Start of the search range
+        end (int): End of the search range
+        last (bool): Whether to find the last match rather than the first
+        
+    Returns:
+        int: Start index of the match, or -1 if there is none
+    """
+    search_end = end + _SEPARATOR_LOOKAHEAD
+    if not last:
+        match = pattern.search(text, start, search_end)
+        return match.start() if match and match.start() <= end else -1
+    position = -1
+    for match in pattern.finditer(text, start, search_end):
+        if match.start() > end:
+            break
+        position = match.start()
+    return position
 
 
-def chunk_text_recursive(text: str, chunk_size: int = 500, chunk_overlap: int = 150) -> List[str]:
+def _fast_split(text: str, chunk_size: int, chunk_overlap: int) -> List[str]:
     """
-    Split text into chunks using LangChain's RecursiveCharacterTextSplitter.
+    Split text with a sliding character window along MARKDOWN_SEPARATORS, keeping sections (text between
+    headings, code fence ends and horizontal rules) apart as the recursive splitter does. A chunk that starts
+    a section ends on the last such separator in the window, so small sections are merged; a chunk that
+    continues a section ends on the first one. The next chunk then starts at that separator. Without
+    one, a chunk ends on the latest paragraph, line or word break near the window end and the next chunk
+    starts chunk_overlap characters back.
     
     Args:
         text (str): Text to be chunked
@@ -172,27 +502,209 @@ def chunk_text_recursive(text: str, chunk_size: int = 500, chunk_overlap: int =
         
     Returns:
         List[str]: List of text chunks
+        
+    Raises:
+        ValueError: If chunk_overlap is not smaller than chunk_size
     """
-    if not text or not text.strip():
-        return []
+    # Same check as RecursiveCharacterTextSplitter; an overlap as large as the window would advance one character per chunk
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"Got a chunk overlap ({chunk_overlap}) not smaller than chunk size ({chunk_size}), should be smaller.")
+    
+    chunks = []
+    length = len(text)
+    # How far back from the window end a paragraph, line or word break may be to end the chunk on
+    lookback = max(1, (chunk_size - chunk_overlap) // 2)
+    start = 0
+    # Whether the current chunk starts at the beginning of a section
+    at_section = True
+    while start < length:
+        end = min(start + chunk_size, length)
+        starts_section = at_section
+        at_section = False
+        # The rest of the text fits unless it continues a section into the next one
+        if end < length or not starts_section:
+            for pattern in _STRUCTURAL_SEPARATOR_RES:
+                cut = _find_separator(pattern, text, start + 1, end, last = starts_section)
+                if cut > start:
+                    end = cut
+                    at_section = True
+                    break
+        if end < length and not at_section:
+            for separator in _BOUNDARY_SEPARATORS:
+                cut = text.rfind(separator, end - lookback, end)
+                if cut > start:
+                    end = cut
+                    break
+        
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end == length:
+            break
+        
+        # A new section starts its own chunk without overlap
+        if at_section:
+            start = end
+            continue
+        
+        # Begin the next chunk on a word boundary within the overlap
+        next_start = end - chunk_overlap
+        space = text.find(' ', next_start, end)
+        if space != -1:
+            next_start = space + 1
+        start = max(next_start, start + 1)
     
-    # Initialize the text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
+    return chunks
+
+
+@lru_cache(maxsize = 8)
+def _get_splitter(chunk_size: int, chunk_overlap: int, separators: Tuple[str, ...]) -> RecursiveCharacterTextSplitter:
+    """
+    Get a text splitter for the given settings. Cached, so pages chunked with the same settings share one splitter.
+    
+    Args:
+        chunk_size (int): Maximum size of each chunk in characters
+        chunk_overlap (int): Number of characters to overlap between chunks
+        separators (Tuple[str, ...]): Regex separators, in order of preference
+        
+    Returns:
+        RecursiveCharacterTextSplitter: Configured text splitter
+    """
+    return RecursiveCharacterTextSplitter(
+        separators = list(separators),
         chunk_size = chunk_size,
         chunk_overlap = chunk_overlap,
         length_function = len,
-        is_separator_regex = False,
+        is_separator_regex = True,
     )
+
+
+def chunk_text_recursive(text: str, chunk_size: int = 500, chunk_overlap: int = 150,
+                         separators: Optional[List[str]] = None) -> List[str]:
+    """
+    Split text into chunks along markdown-aware separators, so chunks break at headings, code fences
+    and horizontal rules before paragraphs, lines and words. By default a fast sliding-window splitter
+    follows MARKDOWN_SEPARATORS; passing custom separators uses LangChain's RecursiveCharacterTextSplitter
+    with those separators instead.
+    
+    Args:
+        text (str): Text to be chunked
+        chunk_size (int): Maximum size of each chunk in characters
+        chunk_overlap (int): Number of characters to overlap between chunks
+        separators (Optional[List[str]]): Regex separators for the recursive splitter (None for the fast splitter)
+        
+    Returns:
+        List[str]: List of text chunks
+    """
+    if not text or not text.strip():
+        return []
+    
+    if separators is None:
+        return _fast_split(text, chunk_size, chunk_overlap)
     
     # Split the text and return chunks
-    chunks = text_splitter.split_text(text)
+    chunks = _get_splitter(chunk_size, chunk_overlap, tuple(separators)).split_text(text)
     
     return chunks
 
 
+# Embedding model used for both documents and queries
+EMBEDDING_MODEL_NAME = "BAAI/bge-small-en-v1.5"
+
+# ONNX export of the embedding model with int8 dynamically quantized weights (built by the Dockerfile).
+# Used when present; otherwise the PyTorch model above is loaded from the Hugging Face hub.
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", "/models/bge-small-en-v1.5-onnx")
+
+
+def _default_onnx_file() -> str:
+    """
+    Pick the int8 ONNX export whose quantization settings match this machine's CPU.
+    
+    Returns:
+        str: Path of the ONNX file relative to EMBEDDING_ONNX_DIR
+    """
+    if platform.machine().lower() in ('aarch64', 'arm64'):
+        return "onnx/model_qint8_arm64.onnx"
+    
+    # VNNI int8 dot-product instructions make the avx512_vnni export the fastest where available
+    try:
+        with open('/proc/cpuinfo') as cpuinfo:
+            has_vnni = 'avx512_vnni' in cpuinfo.read()
+    except OSError:
+        has_vnni = False
+    return "onnx/model_qint8_avx512_vnni.onnx" if has_vnni else "onnx/model_qint8_avx2.onnx"
+
+
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE") or _default_onnx_file()
+
+# Directory the Chroma index is persisted in, so documents indexed by an earlier run aren't embedded again
+CHROMA_DIR = os.getenv("CHROMA_DIR", ".chroma")
+
+# HNSW index settings tuned for a read-heavy workload: a denser graph built once, modest search breadth per query
+COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64
+}
+
+
+@lru_cache(maxsize = 1)
+def get_embedding_function():
+    """
+    Get the embedding function used for the Chroma collections and for query embeddings.
+    The model is loaded once per process and shared by all callers.
+    
+    Returns:
+        EmbeddingFunction: ChromaDB embedding function wrapping the sentence transformer model
+    """
+    # Prefer the int8 ONNX Runtime model: same 384-dim output, much cheaper matmuls on CPU
+    if os.path.exists(os.path.join(EMBEDDING_ONNX_DIR, EMBEDDING_ONNX_FILE)):
+        return embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name = EMBEDDING_ONNX_DIR,
+            backend = "onnx",
+            model_kwargs = {"file_name": EMBEDDING_ONNX_FILE}
+        )
+    
+    # PyTorch fallback: use every core for the matmuls, with no extra inter-op threads competing for them
+    import torch
+    torch.set_num_threads(int(os.getenv("ST_THREADS", os.cpu_count() or 1)))
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Can only be set before any inter-op parallel work has started in this process
+        pass
+    
+    # Optional half precision, only on a GPU (FP16 matmuls are slower than FP32 on most CPUs).
+    # The constructor arguments end up in the collection's JSON config, so convert the loaded model
+    # afterwards instead of passing a torch dtype through them.
+    use_fp16 = os.getenv("FP16_EMBED") == "1" and torch.cuda.is_available()
+    embedding_function = embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name = EMBEDDING_MODEL_NAME,
+        device = "cuda" if use_fp16 else "cpu"
+    )
+    if use_fp16:
+        embedding_function._model.half()
+    
+    return embedding_function
+
+
+@lru_cache(maxsize = 1)
+def _get_client():
+    """
+    Get the ChromaDB client shared by all collection accesses.
+    
+    Returns:
+        ClientAPI: ChromaDB persistent client storing its data in CHROMA_DIR
+    """
+    return chromadb.PersistentClient(path = CHROMA_DIR)
+
+
+@lru_cache(maxsize = 32)
 def access_chroma_collection(name: str):
     """
-    Get or create a Chroma collection with the given name using ephemeral client.
+    Get or create a Chroma collection with the given name using the persistent client.
+    The collection handle is cached, so repeated calls on the retrieval hot path are free.
     
     Args:
         name (str): Name of the collection
@@ -200,70 +712,190 @@ def access_chroma_collection(name: str):
     Returns:
         Collection: ChromaDB collection object
     """
-    client = chromadb.EphemeralClient()
-    sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name = "BAAI/bge-small-en-v1.5"
+    collection = _get_client().get_or_create_collection(
+        name = name,
+        embedding_function = get_embedding_function(),
+        metadata = COLLECTION_METADATA
     )
-    collection = client.get_or_create_collection(name = name, embedding_function = sentence_transformer_ef)
     return collection
 
 
+def _index_marker_path(name: str, doc_hash: str) -> str:
+    """
+    Get the path of the marker file recording that a document was fully indexed into a collection.
+    
+    Args:
+        name (str): Collection name
+        doc_hash (str): Content hash of the document from compute_file_hash
+        
+    Returns:
+        str: Marker path, stored next to the Chroma index in CHROMA_DIR
+    """
+    return os.path.join(CHROMA_DIR, "indexed", name, doc_hash)
 
-def preprocess_text(pages: List[Dict[str, Any]], chunk_size: int = 500, chunk_overlap: int = 150) -> List[Dict[str, Any]]:
+
+def is_document_indexed(name: str, doc_hash: str) -> bool:
     """
-    Clean and chunk text from parsed pages, retaining metadata.
+    Check whether a document with the given content hash was fully indexed into a collection.
+    Chunks alone don't count, since an interrupted upload can leave part of a document behind.
     
     Args:
-        pages (List[Dict[str, Any]]): Output from parse_pdf function
+        name (str): Collection name
+        doc_hash (str): Content hash of the document from compute_file_hash
+        
+    Returns:
+        bool: True if mark_document_indexed was called for the document
+    """
+    return os.path.exists(_index_marker_path(name, doc_hash))
+
+
+def mark_document_indexed(name: str, doc_hash: str) -> None:
+    """
+    Record that all chunks of a document have been added to a collection.
+    
+    Args:
+        name (str): Collection name
+        doc_hash (str): Content hash of the document from compute_file_hash
+    """
+    marker_path = _index_marker_path(name, doc_hash)
+    os.makedirs(os.path.dirname(marker_path), exist_ok = True)
+    open(marker_path, 'w').close()
+
+
+def discard_document(name: str, doc_hash: str) -> None:
+    """
+    Delete any chunks of a document that isn't marked as indexed, e.g. left over from a failed upload.
+    
+    Args:
+        name (str): Collection name
+        doc_hash (str): Content hash of the document from compute_file_hash
+    """
+    access_chroma_collection(name).delete(where = {"doc_hash": doc_hash})
+
+
+def embed_query(query: str) -> np.ndarray:
+    """
+    Embed a query with the collection embedding model.
+    
+    Args:
+        query (str): Query text
+        
+    Returns:
+        np.ndarray: L2-normalized query embedding
+    """
+    embedding = np.asarray(get_embedding_function()([query])[0], dtype = np.float32)
+    return embedding / np.linalg.norm(embedding)
+
+
+
+# Pages per preprocessing batch below which the work is done in-process rather than in the page pool
+PARALLEL_PREPROCESS_MIN_PAGES = 4
+
+
+def _process_page(page: Dict[str, Any], chunk_size: int, chunk_overlap: int) -> List[Dict[str, Any]]:
+    """
+    Clean and chunk the text of a single page, retaining metadata.
+    
+    Args:
+        page (Dict[str, Any]): Page dictionary from parse_pdf
         chunk_size (int): Size for text chunking
         chunk_overlap (int): Overlap for text chunking
         
     Returns:
-        List[Dict[str, Any]]: List of chunk dictionaries with metadata
+        List[Dict[str, Any]]: Chunk dictionaries with metadata for the page (empty for blank pages)
     """
-    chunk_documents = []
+    # Clean the text
+    cleaned_text = clean_text(page['text'])
     
-    for page in pages:
-        # Clean the text
-        cleaned_text = clean_text(page['text'])
-        
-        # Skip empty pages
-        if not cleaned_text.strip():
-            continue
-            
-        # Chunk the cleaned text
-        chunks = chunk_text_recursive(cleaned_text, chunk_size, chunk_overlap)
+    # Skip empty pages
+    if not cleaned_text.strip():
+        return []
         
-        # Create chunk documents with metadata
-        for chunk_num, chunk_text in enumerate(chunks):
-            chunk_doc = {
-                # Original page metadata
+    # Chunk the cleaned text
+    chunks = chunk_text_recursive(cleaned_text, chunk_size, chunk_overlap)
+    
+    # Create chunk documents with the metadata stored in Chroma ready to use
+    chunk_documents = []
+    for chunk_num, chunk_text in enumerate(chunks):
+        chunk_doc = {
+            'text': chunk_text,
+            '_metadata': {
                 'filename': page['filename'],
                 'page': page['page'],
-                'text_format': page['text_format'],
-                'extraction_method': page['extraction_method'],
-                'page_has_tables': page['has_tables'],
-                'page_char_count': page['char_count'],
-                'page_word_count': page['word_count'],
-                'page_line_count': page['line_count'],
-                'page_images_extracted': page['images_extracted'],
-                'page_source_bbox': page['source_bbox'],
-                'page_source_page_size': page['source_page_size'],
-                # Chunk-specific data
-                'text': chunk_text,
                 'chunk_number': chunk_num + 1,
-                'total_chunks_for_page': len(chunks),
-                'chunk_char_count': len(chunk_text),
-                'chunk_word_count': len(chunk_text.split()),
-                'is_chunked': True,
-                'chunk_size_used': chunk_size,
-                'chunk_overlap_used': chunk_overlap
+                'chunk_char_count': len(chunk_text)
             }
-            chunk_documents.append(chunk_doc)
+        }
+        # pymupdf4llm's page metadata, kept only when parsing was asked to (already a JSON string)
+        if page.get('source_metadata') is not None:
+            chunk_doc['_metadata']['source_metadata'] = page['source_metadata']
+        # Content hash of the file, used to recognize documents that are already indexed
+        if page.get('doc_hash') is not None:
+            chunk_doc['_metadata']['doc_hash'] = page['doc_hash']
+        chunk_documents.append(chunk_doc)
     
     return chunk_documents
 
 
+def iter_chunks(pages: List[Dict[str, Any]], chunk_size: int = 500, chunk_overlap: int = 150) -> Iterator[Dict[str, Any]]:
+    """
+    Clean and chunk text from parsed pages, retaining metadata. Pages are processed in parallel
+    across worker processes, since cleaning and splitting are CPU-bound and independent per page.
+    Chunks are yielded page by page, in page order, as the workers finish them.
+    
+    Args:
+        pages (List[Dict[str, Any]]): Output from parse_pdf function
+        chunk_size (int): Size for text chunking
+        chunk_overlap (int): Overlap for text chunking
+        
+    Yields:
+        Dict[str, Any]: Chunk dictionary with metadata
+    """
+    sizes = (repeat(chunk_size), repeat(chunk_overlap))
+    
+    # Small batches, or a single core, aren't worth the cost of shipping pages to the workers
+    workers = os.cpu_count() or 1
+    if workers == 1 or len(pages) < PARALLEL_PREPROCESS_MIN_PAGES:
+        for chunks in map(_process_page, pages, *sizes):
+            yield from chunks
+        return
+    
+    # Pages are independent, so if a worker dies the remaining ones are retried once on a fresh pool
+    done = 0
+    for attempt in range(2):
+        try:
+            for chunks in _get_page_pool().map(_process_page, pages[done:], *sizes, chunksize = 4):
+                done += 1
+                yield from chunks
+            return
+        except BrokenProcessPool:
+            _get_page_pool.cache_clear()
+            if attempt:
+                raise
+            logger.warning("Worker pool broke while chunking, retrying the remaining %d pages", len(pages) - done)
+
+
+# Number of chunks embedded and inserted per collection.add call
+ADD_BATCH_SIZE = 64
+
+# Number of add batches taken from the chunk stream and length-sorted together
+ADD_SORT_WINDOW_BATCHES = 4
+
+
+def _chunk_id(metadata: Dict[str, Any]) -> str:
+    """
+    Create a short, fixed-length unique ID for a chunk from its document, page and chunk number.
+    
+    Args:
+        metadata (Dict[str, Any]): Chunk metadata from _process_page
+        
+    Returns:
+        str: 16-character hex digest of {doc_hash or filename}|{page}|{chunk_number}
+    """
+    key = f"{metadata.get('doc_hash') or metadata['filename']}|{metadata['page']}|{metadata['chunk_number']}"
+    return hashlib.blake2b(key.encode(), digest_size = 8).hexdigest()
+
+
 def add_documents(name: str, documents: List[Dict[str, Any]]) -> None:
     """
     Add documents to a ChromaDB collection.
@@ -273,36 +905,30 @@ def add_documents(name: str, documents: List[Dict[str, Any]]) -> None:
         documents (List[Dict[str, Any]]): List of document dictionaries
     """
     collection = access_chroma_collection(name)
-    chunk_documents = preprocess_text(documents)
-
-    # Prepare data for ChromaDB
-    ids = []
-    texts = []
-    metadatas = []
-    
-    for doc in chunk_documents:
-        # Create unique ID: {filename}_page{page}_chunk{chunk}
-        doc_id = f"{doc['filename']}_page{doc['page']}_chunk{doc['chunk_number']}"
-        ids.append(doc_id)
-        texts.append(doc['text'])
-        
-        # Prepare metadata (exclude text and None values)
-        metadata = {}
-        for key, value in doc.items():
-            if key != 'text' and value is not None:
-                metadata[key] = value
-        
-        metadatas.append(metadata)
+    chunks = iter_chunks(documents)
     
-    # Add to collection
-    collection.add(
-        ids = ids,
-        documents = texts,
-        metadatas = metadatas
-    )
+    # Take a bounded window of chunks at a time, so only a few batches are held in memory
+    while window := list(islice(chunks, ADD_BATCH_SIZE * ADD_SORT_WINDOW_BATCHES)):
+        # Order chunks by length so each embedding batch holds similarly sized texts (less padding)
+        window.sort(key = lambda doc: len(doc['text']))
+        
+        for start in range(0, len(window), ADD_BATCH_SIZE):
+            batch = window[start:start + ADD_BATCH_SIZE]
+            
+            # Prepare data for ChromaDB; metadata comes precomputed from _process_page
+            metadatas = [doc['_metadata'] for doc in batch]
+            ids = [_chunk_id(metadata) for metadata in metadatas]
+            texts = [doc['text'] for doc in batch]
+            
+            # Add each batch on its own to bound the memory of each embedding call
+            collection.add(
+                ids = ids,
+                documents = texts,
+                metadatas = metadatas
+            )
 
 
-def retrieve_documents(name: str, query: str, top_k: int = 5) -> Dict[str, Any]:
+def retrieve_documents(name: str, query: str, top_k: int = 5, query_embedding: Optional[np.ndarray] = None) -> Dict[str, Any]:
     """
     Query documents from a ChromaDB collection.
     
@@ -310,15 +936,22 @@ def retrieve_documents(name: str, query: str, top_k: int = 5) -> Dict[str, Any]:
         name (str): Collection name
         query (str): Query text
         top_k (int): Number of top results to return
+        query_embedding (Optional[np.ndarray]): Precomputed embedding of the query, skips embedding it again
         
     Returns:
         Dict[str, Any]: Query results from ChromaDB
     """
     collection = access_chroma_collection(name)
     
-    results = collection.query(
-        query_texts = [query],
-        n_results = top_k
-    )
+    if query_embedding is not None:
+        results = collection.query(
+            query_embeddings = [query_embedding],
+            n_results = top_k
+        )
+    else:
+        results = collection.query(
+            query_texts = [query],
+            n_results = top_k
+        )
     
     return results
\ No newline at end of file
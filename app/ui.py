@@ -0,0 +1,183 @@
+# PDF Explainer Chatbot - Gradio interface for uploading PDFs and asking questions about their content
+
+import os
+import gradio as gr
+from itertools import islice
+from typing import List, Generator, Dict, Any, Tuple
+from llm import chat_with_assistant_rag, clear_retrieval_cache, SYSTEM_MESSAGE
+from retrieval import access_chroma_collection, parse_pdfs, add_documents, retrieve_documents, compute_file_hash, is_document_indexed, mark_document_indexed, discard_document
+
+# Global collection name
+COLLECTION_NAME = "pdf_collection"
+
+# Number of parsed pages indexed at a time during upload
+UPLOAD_BATCH_SIZE = 32
+
+def handle_pdf_upload(files: List[Any]) -> str:
+    """
+    Process uploaded PDF files and add them to the Chroma collection.
+    
+    Args:
+        files (List[Any]): List of uploaded file objects
+        
+    Returns:
+        str: Status message about the upload process
+    """
+    if not files:
+        return "No files uploaded."
+    
+    try:
+        # Skip files whose contents are already indexed (e.g. by an earlier run), so they aren't parsed and embedded again
+        doc_hashes = [compute_file_hash(file.name) for file in files]
+        indexed_indices = {i for i, doc_hash in enumerate(doc_hashes) if is_document_indexed(COLLECTION_NAME, doc_hash)}
+        
+        # Parse identical files in the same upload (the same file picked twice, renamed copies) only once:
+        # their chunks would get the same ids. The copies are reported along with the file that is indexed.
+        new_indices = []
+        first_index_by_hash = {}
+        duplicate_indices = {}
+        for i, doc_hash in enumerate(doc_hashes):
+            if i in indexed_indices:
+                continue
+            if doc_hash in first_index_by_hash:
+                duplicate_indices[i] = first_index_by_hash[doc_hash]
+            else:
+                first_index_by_hash[doc_hash] = i
+                new_indices.append(i)
+        
+        # Drop chunks an interrupted earlier upload may have left for these files, so they are indexed from scratch
+        for i in new_indices:
+            discard_document(COLLECTION_NAME, doc_hashes[i])
+        
+        # Parse the new PDFs in parallel and add pages to the collection in batches as they arrive,
+        # so memory stays bounded by the batch size rather than the document size
+        pages = parse_pdfs([files[i].name for i in new_indices], doc_hashes = [doc_hashes[i] for i in new_indices])
+        parsed_indices = set()
+        try:
+            while batch := list(islice(pages, UPLOAD_BATCH_SIZE)):
+                add_documents(COLLECTION_NAME, batch)
+                parsed_indices.update(new_indices[page['file_index']] for page in batch)
+        except Exception:
+            # Don't leave partially indexed documents behind
+            for i in new_indices:
+                discard_document(COLLECTION_NAME, doc_hashes[i])
+            clear_retrieval_cache()
+            raise
+        
+        # Only now are these documents complete, so later uploads of the same files may skip them
+        for i in parsed_indices:
+            mark_document_indexed(COLLECTION_NAME, doc_hashes[i])
+        if parsed_indices:
+            clear_retrieval_cache()
+        # Copies count as already indexed when the file they duplicate was indexed
+        skipped_indices = indexed_indices | {i for i, first_index in duplicate_indices.items() if first_index in parsed_indices}
+        processed_files = [os.path.basename(files[i].name) for i in sorted(parsed_indices)]  # Get filename only
+        skipped_files = [os.path.basename(files[i].name) for i in sorted(skipped_indices)]
+        
+        if processed_files or skipped_files:
+            status = []
+            if processed_files:
+                status.append(f"✅ Successfully processed and indexed: {', '.join(processed_files)}.")
+            if skipped_files:
+                status.append(f"♻️ Already indexed (skipped): {', '.join(skipped_files)}.")
+            status.append("The documents are now available for questions!")
+            return " ".join(status)
+        else:
+            return "❌ Failed to process the uploaded files. Please check the file format."
+            
+    except Exception as e:
+        return f"❌ Error processing files: {str(e)}"
+
+def respond(message: str, history: List[Dict[str, Any]], request: gr.Request) -> Generator[str, None, None]:
+    """
+    Handle user messages and return streaming responses with RAG.
+    
+    Args:
+        message (str): User message
+        history (List[Dict[str, Any]]): Conversation history
+        request (gr.Request): Incoming request, injected by Gradio (identifies the session)
+        
+    Yields:
+        str: Streaming response chunks
+    """
+    if not message.strip():
+        yield "Please enter a message."
+        return
+    
+    # Get the streaming generator and yield each response
+    session_id = request.session_hash if request else None
+    for partial_response in chat_with_assistant_rag(message, history, COLLECTION_NAME, session_id):
+        yield partial_response
+
+# Create the chatbot interface with file upload
+with gr.Blocks(title = "PDF Explainer Chatbot") as demo:
+    gr.Markdown("# 📄 PDF Explainer Chatbot")
+    gr.Markdown("""
+    **I'm an AI assistant that can help you with general questions and analyze PDF documents you upload.**
+    
+    - 💬 **Chat normally**: Ask me anything, even without uploading PDFs
+    - 📤 **Upload PDFs**: Add documents anytime to get document-specific answers  
+    - 🔄 **Multiple uploads**: You can upload more PDFs during our conversation
+    - 🎯 **Smart retrieval**: I'll automatically find relevant content from your PDFs when answering questions
+    """)
+    
+    # File upload component
+    with gr.Row():
+        file_upload = gr.File(
+            label = "📄 Upload PDF Documents (Optional)",
+            file_count = "multiple",
+            file_types = [".pdf"],
+            type = "filepath",
+            height = 100
+        )
+        upload_button = gr.Button("🚀 Process PDFs", variant = "primary", size = "sm")
+    
+    # Upload status
+    upload_status = gr.Textbox(label = "Upload Status", interactive = False, visible = False)
+    
+    # Chat interface
+    chatbot = gr.ChatInterface(
+        fn = respond,
+        type = "messages",
+        title = "💬 Chat",
+        description = "Ask me anything! If you've uploaded PDFs, I'll use them to provide more accurate answers."
+    )
+    
+    # Handle file upload
+    def show_status_and_process(files: List[Any]) -> tuple[str, Dict[str, Any]]:
+        """
+        Process files and show status.
+        
+        Args:
+            files (List[Any]): List of uploaded file objects
+            
+        Returns:
+            tuple[str, Dict[str, Any]]: Status message and visibility update
+        """
+        result = handle_pdf_upload(files)
+        return result, gr.update(visible = True)
+    
+    upload_button.click(
+        fn = show_status_and_process,
+        inputs = [file_upload],
+        outputs = [upload_status, upload_status]
+    )
+
+def launch() -> None:
+    """
+    Initialize the collection, warm up retrieval and start the Gradio server.
+    """
+    # Initialize the Chroma collection
+    collection = access_chroma_collection(COLLECTION_NAME)
+    print(f"✅ Initialized collection: {COLLECTION_NAME}")
+    
+    # Pre-warm the embedding model and index so the first question doesn't pay the load cost
+    retrieve_documents(COLLECTION_NAME, "warm up", top_k = 1)
+    
+    # Enable queuing for streaming support. Chat turns mostly wait on Groq and Chroma,
+    # so let several run at once instead of Gradio's default of one at a time
+    demo.queue(default_concurrency_limit = 8, max_size = 64).launch(
+        server_name = "0.0.0.0",
+        server_port = 7860,
+        max_threads = 32
+    )